@@ -14,8 +14,12 @@ import re
 import copy
 import io
 import glob
-from docx import Document
-from docx.oxml.ns import qn
+import mmap
+import zipfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from lxml import etree
 
 INPUT_DIR = 'input'
 OUTPUT_DIR = 'output'
@@ -38,10 +42,32 @@ SECTION_TITLE_PATTERNS = [
     'unit i', 'unit ii', 'unit iii', 'unit iv', 'unit v', 'unit vi',
 ]
 
-# Body element tags
-W_P = qn('w:p')      # paragraph
-W_TBL = qn('w:tbl')  # table
-W_SECT_PR = qn('w:sectPr')  # section properties (page layout)
+# All known title fragments fused into a single alternation, so a marker
+# candidate is validated in one scan instead of ~20 substring searches
+TITLE_RE = re.compile('|'.join(re.escape(p) for p in SECTION_TITLE_PATTERNS))
+
+# WordprocessingML namespace and the element tags we care about.
+# Defined locally so the source side needs only lxml, not python-docx.
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W_BODY = f'{{{W_NS}}}body'
+W_P = f'{{{W_NS}}}p'          # paragraph
+W_TBL = f'{{{W_NS}}}tbl'      # table
+W_BR = f'{{{W_NS}}}br'        # line break
+W_SECT_PR = f'{{{W_NS}}}sectPr'  # section properties (page layout)
+
+
+def _fast_clone(element):
+    """
+    Deep-copy an lxml element via copy.copy, which lxml implements as a
+    single C-level tree copy — much faster than copy.deepcopy's generic
+    Python attribute walk over the same tree.
+    """
+    return copy.copy(element)
+
+
+# Compiled once; selects a paragraph's text nodes and line breaks in
+# document order, evaluated inside libxml2 instead of a Python run walk
+_PARA_TEXT_PARTS = etree.XPath('.//w:t|.//w:br', namespaces={'w': W_NS})
 
 
 def get_paragraph_text(element):
@@ -49,15 +75,20 @@ def get_paragraph_text(element):
     Extract plain text from a w:p element, inserting \\n for w:br elements.
     This allows detection of inline section markers after line breaks.
     """
-    ns = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-    parts = []
-    for run in element.findall(f'{{{ns}}}r'):
-        for child in run:
-            if child.tag == f'{{{ns}}}t' and child.text:
-                parts.append(child.text)
-            elif child.tag == f'{{{ns}}}br':
-                parts.append('\n')
-    return ''.join(parts).strip()
+    return ''.join(
+        '\n' if part.tag == W_BR else (part.text or '')
+        for part in _PARA_TEXT_PARTS(element)
+    ).strip()
+
+
+@lru_cache(maxsize=1024)
+def _title_hit(after_letter):
+    """
+    Memoized title check: the same handful of section titles ("Summary &
+    Concept Map", ...) recurs at every chapter, so each distinct string
+    is only ever scanned once.
+    """
+    return TITLE_RE.search(after_letter) is not None
 
 
 def is_real_section_marker(full_text, letter):
@@ -69,114 +100,249 @@ def is_real_section_marker(full_text, letter):
     after_letter = full_text.split('.', 1)[1].strip().lower() if '.' in full_text else ''
 
     # Check if any known section title fragment appears
-    for pattern in SECTION_TITLE_PATTERNS:
-        if pattern in after_letter:
-            return True
+    return _title_hit(after_letter)
 
-    return False
 
-
-def find_section_boundaries(body):
+def find_section_boundaries(document_xml):
     """
-    Scan all body children to find section boundaries.
-    Returns a list of (element_index, section_letter) for each section marker.
+    Stream word/document.xml with iterparse to find section boundaries.
+    Each element is inspected on its end event and freed immediately, so
+    the scan never holds the full tree in memory — only the element
+    indices survive. (The full tree is parsed separately, and only where
+    sections are actually sliced: in the pool workers or the sequential
+    fallback.)
+
+    Markers are returned structure-of-arrays style as
+    (boundary_idx, boundary_letters, total_elements, last_content_idx):
+    a compact int array of body-element indices, the parallel string of
+    section letters, the body child count, and the index of the last
+    non-sectPr body child.
 
     Also detects inline section markers embedded via newline characters
     (e.g. "Chapter 1: Sets\\nA. Summary & Concept Map").
     """
-    boundaries = []
-    children = list(body)
+    boundary_idx = array('i')
+    boundary_letters = []
+    idx = -1
+    last_content_idx = -1
+
+    for _, child in etree.iterparse(io.BytesIO(document_xml), events=('end',)):
+        # End events fire for every element; only direct body children
+        # advance the element index the slicing works with
+        parent = child.getparent()
+        if parent is None or parent.tag != W_BODY:
+            continue
+        idx += 1
+        if child.tag != W_SECT_PR:
+            last_content_idx = idx
 
-    for idx, child in enumerate(children):
         if child.tag == W_P:
             txt = get_paragraph_text(child)
-            if not txt:
-                continue
-
-            # Check if the paragraph itself starts with a section marker
-            m = SECTION_RE.match(txt)
-            if m:
-                letter = m.group(1)
-                if is_real_section_marker(txt, letter):
-                    boundaries.append((idx, letter))
-                continue
+            matched = False
+
+            # Check if the paragraph itself starts with a section marker.
+            # Cheap prefix gate first: a marker must look like "X." with
+            # X in A-G, which lets the vast majority of paragraphs skip
+            # the regex machinery entirely.
+            if txt and 'A' <= txt[0] <= 'G' and txt[1:2] == '.':
+                m = SECTION_RE.match(txt)
+                if m:
+                    matched = True
+                    letter = m.group(1)
+                    if is_real_section_marker(txt, letter):
+                        boundary_idx.append(idx)
+                        boundary_letters.append(letter)
 
             # Check for inline section marker after a newline
             # (handles cases like "Chapter 1: Sets\nA. Summary...")
-            if '\n' in txt:
+            if not matched and '\n' in txt:
                 lines = txt.split('\n')
                 for line in lines[1:]:  # skip first line
                     line = line.strip()
+                    if not (line and 'A' <= line[0] <= 'G' and line[1:2] == '.'):
+                        continue
                     m = SECTION_RE.match(line)
                     if m:
                         letter = m.group(1)
                         if is_real_section_marker(line, letter):
-                            boundaries.append((idx, letter))
+                            boundary_idx.append(idx)
+                            boundary_letters.append(letter)
                             break  # only take the first inline match
 
-    return boundaries
+        # Free the inspected subtree and any already-freed siblings so
+        # memory stays flat over the scan
+        child.clear()
+        while child.getprevious() is not None:
+            del parent[0]
+
+    return boundary_idx, ''.join(boundary_letters), idx + 1, last_content_idx
 
 
-def group_into_units(boundaries):
+def plan_sections(boundary_idx, boundary_letters, last_content_idx):
     """
-    Group section boundaries into unit-chunks.
-    Each chunk starts with Section A and contains all subsequent sections
-    until the next A (or end of document).
+    Resolve every section marker into a ready-to-write entry dict with
+    its unit number and precomputed element range:
 
-    Returns list of lists: [[boundary1, boundary2, ...], ...]
-    Each boundary is (element_index, section_letter).
+        {'unit_num': int, 'letter': str, 'start': int, 'end': int}
+
+    One linear walk over the marker arrays: every 'A' after the first
+    marker starts a new unit, a section ends at the element before the
+    next marker, and the last section runs to the document's last
+    content element. The output loop just consumes flat entries without
+    searching.
     """
-    units = []
-    current_unit = []
+    entries = []
+    n_markers = len(boundary_idx)
+    unit_num = 1
+
+    for k in range(n_markers):
+        letter = boundary_letters[k]
+        if letter == 'A' and k > 0:
+            unit_num += 1
 
-    for boundary in boundaries:
-        letter = boundary[1]
-        if letter == 'A' and current_unit:
-            units.append(current_unit)
-            current_unit = []
-        current_unit.append(boundary)
+        if k + 1 < n_markers:
+            elem_end = boundary_idx[k + 1] - 1
+        else:
+            elem_end = last_content_idx
 
-    if current_unit:
-        units.append(current_unit)
+        entries.append({
+            'unit_num': unit_num,
+            'letter': letter,
+            'start': boundary_idx[k],
+            'end': elem_end,
+        })
 
-    return units
+    return entries
 
 
-def create_section_file(raw_bytes, body, section_start_idx, section_end_idx, output_path):
+def _build_skeleton(document_root):
     """
-    Create a new DOCX for a single section by:
-    1. Cloning the source document (preserves styles, numbering, fonts, themes, images)
-    2. Replacing the body with only the elements for this section
+    Clone the parsed w:document element, strip the clone's body down to
+    its sectPr, and return (skeleton_bytes, body_pos, has_sectPr).
+    Every section file instantiates its root by re-parsing these few KB
+    — the serialize-once / fromstring-per-instance pattern — so no zip
+    unpack or full-document re-parse happens per section. The skeleton's
+    layout is fixed, so its body position and sectPr presence are
+    resolved here once; per-section code indexes instead of find()ing.
     """
-    # Clone from raw bytes
-    new_doc = Document(io.BytesIO(raw_bytes))
-    new_body = new_doc.element.body
-
-    # Collect all source body children to copy
-    source_children = list(body)
-
-    # Identify elements to keep: from section_start_idx to section_end_idx (inclusive)
-    elements_to_keep = []
-    for i in range(section_start_idx, section_end_idx + 1):
-        if i < len(source_children):
-            elements_to_keep.append(copy.deepcopy(source_children[i]))
-
-    # Clear the cloned document's body (keep sectPr for page layout)
-    sectPr = None
-    for child in list(new_body):
-        if child.tag == W_SECT_PR:
-            sectPr = child
-        else:
-            new_body.remove(child)
+    skeleton = _fast_clone(document_root)
+    skeleton_body = skeleton.find(W_BODY)
+
+    # Each lxml remove() rescans the child list, so removing one-by-one
+    # is quadratic; detach everything at once and put sectPr back.
+    sectPr = skeleton_body.find(W_SECT_PR)
+    skeleton_body.clear()
+    if sectPr is not None:
+        skeleton_body.append(sectPr)
+
+    return (etree.tostring(skeleton),
+            skeleton.index(skeleton_body),
+            sectPr is not None)
 
-    # Insert our section elements
-    for elem in elements_to_keep:
-        if sectPr is not None:
-            sectPr.addprevious(elem)
-        else:
-            new_body.append(elem)
 
-    new_doc.save(output_path)
+class _SeekableMmap(mmap.mmap):
+    """
+    mmap with the seekable() marker zipfile's file-like protocol expects
+    (mmap itself only grew seekable() in Python 3.13).
+    """
+
+    def seekable(self):
+        return True
+
+
+def _read_source_parts(src_zip):
+    """
+    Read every part of the source docx except word/document.xml from an
+    already-open ZipFile. These bytes (styles, numbering, fonts, themes,
+    media, rels) are identical across all output files, so they are
+    captured once and copied verbatim into each output zip.
+    """
+    return [(name, src_zip.read(name))
+            for name in src_zip.namelist()
+            if name != 'word/document.xml']
+
+
+def _write_docx(output_path, source_parts, document_xml):
+    """
+    Write an output docx by copying the cached source parts and adding
+    the freshly built word/document.xml. Only document.xml actually
+    changes between sections; level-1 DEFLATE keeps the redundant
+    recompression of the static parts cheap.
+    """
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED,
+                         compresslevel=1) as out_zip:
+        for name, data in source_parts:
+            out_zip.writestr(name, data)
+        out_zip.writestr('word/document.xml', document_xml)
+
+
+def build_section_xml(skeleton, source_children,
+                      section_start_idx, section_end_idx):
+    """
+    Build the word/document.xml bytes for a single section by:
+    1. Instantiating the stripped skeleton (the source w:document minus
+       body content) from its cached serialized bytes
+    2. Filling its empty body with only the elements for this section
+
+    skeleton is the (bytes, body_pos, has_sectPr) triple from
+    _build_skeleton; source_children is the already-materialized list of
+    source body children, built once per worker rather than per section.
+    """
+    skeleton_bytes, body_pos, has_sectPr = skeleton
+
+    # Parse the pre-stripped skeleton; its layout is known, so the body
+    # and its trailing sectPr are reached by index, not find()
+    new_root = etree.fromstring(skeleton_bytes)
+    new_body = new_root[body_pos]
+    sectPr = new_body[-1] if has_sectPr else None
+
+    # Clone and insert the section's elements (section_start_idx through
+    # section_end_idx inclusive) in one batched extend: detach sectPr,
+    # stream the clones straight into the body with no intermediate
+    # list, then put sectPr back at the end
+    if sectPr is not None:
+        new_body.remove(sectPr)
+    stop = min(section_end_idx + 1, len(source_children))
+    new_body.extend(_fast_clone(source_children[i])
+                    for i in range(section_start_idx, stop))
+    if sectPr is not None:
+        new_body.append(sectPr)
+
+    # Serialize only the document part; everything else is copied as-is
+    return etree.tostring(new_root, encoding='UTF-8', standalone=True)
+
+
+def create_section_file(skeleton, source_parts, source_children,
+                        section_start_idx, section_end_idx, output_path):
+    """Build one section's document.xml and write its docx."""
+    document_xml = build_section_xml(skeleton, source_children,
+                                     section_start_idx, section_end_idx)
+    _write_docx(output_path, source_parts, document_xml)
+
+
+# Per-worker state for the process pool: each worker parses the source
+# document once in _pool_init, then every task it runs only pays for its
+# own section's copy + save.
+_worker_skeleton = None
+_worker_source_parts = None
+_worker_children = None
+
+
+def _pool_init(document_xml, source_parts):
+    """Initializer for worker processes: parse the source XML once and
+    derive the stripped skeleton and body child list from it."""
+    global _worker_skeleton, _worker_source_parts, _worker_children
+    root = etree.fromstring(document_xml)
+    _worker_skeleton = _build_skeleton(root)
+    _worker_source_parts = source_parts
+    _worker_children = list(root.find(W_BODY))
+
+
+def _create_section_task(task):
+    """Worker entry point: create one section file from the shared source."""
+    start, end, output_path = task
+    create_section_file(_worker_skeleton, _worker_source_parts,
+                        _worker_children, start, end, output_path)
 
 
 def process_file(input_path, output_folder):
@@ -188,62 +354,74 @@ def process_file(input_path, output_folder):
     print(f"Processing: {input_path}")
     print(f"{'='*60}")
 
-    # Read raw bytes for efficient cloning
-    with open(input_path, 'rb') as f:
-        raw_bytes = f.read()
-
-    doc = Document(input_path)
-    body = doc.element.body
-    body_children = list(body)
-    total_elements = len(body_children)
-
-    print(f"  Total body elements: {total_elements}")
-
-    # Find all section boundaries
-    boundaries = find_section_boundaries(body)
-    print(f"  Found {len(boundaries)} section markers")
-
-    if not boundaries:
-        print(f"  WARNING: No section markers found, skipping this file!")
-        return 0
-
-    # Group into unit-chunks
-    units = group_into_units(boundaries)
-    print(f"  Found {len(units)} unit-chunks")
+    # Memory-map the source zip instead of copying it into a bytes
+    # object: the OS page cache backs the reads and nothing is
+    # duplicated up front. Only the extracted parts outlive the map.
+    with open(input_path, 'rb') as f, \
+            _SeekableMmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            zipfile.ZipFile(mm) as src_zip:
+        # Parse word/document.xml directly with lxml: no Paragraph/Run
+        # wrappers are created, we only ever need the raw w:p/w:tbl
+        # elements.
+        document_xml = src_zip.read('word/document.xml')
+
+        # Find all section boundaries with a streaming scan; the full
+        # body tree is only parsed where sections get sliced
+        # (workers / fallback)
+        boundary_idx, boundary_letters, total_elements, last_content_idx = \
+            find_section_boundaries(document_xml)
+
+        print(f"  Total body elements: {total_elements}")
+        print(f"  Found {len(boundary_idx)} section markers")
+
+        if not boundary_idx:
+            print(f"  WARNING: No section markers found, skipping this file!")
+            return 0
+
+        # The static zip parts are captured once for reuse in every output
+        source_parts = _read_source_parts(src_zip)
+
+    # Resolve boundaries into flat entries with precomputed ranges
+    entries = plan_sections(boundary_idx, boundary_letters, last_content_idx)
+    print(f"  Found {entries[-1]['unit_num']} unit-chunks")
 
     # Create output directory
     os.makedirs(output_folder, exist_ok=True)
 
-    created = 0
-    for unit_idx, unit_boundaries in enumerate(units):
-        unit_num = unit_idx + 1
-
-        for sec_idx, (elem_start, letter) in enumerate(unit_boundaries):
-            if letter in SECTIONS_TO_SKIP:
-                continue
-
-            # Determine end of this section:
-            # - If there's a next section in this unit, end = next_start - 1
-            # - If this is the last section in this unit, check if there's a next unit
-            # - Otherwise, end = last body element (before sectPr)
-            if sec_idx + 1 < len(unit_boundaries):
-                elem_end = unit_boundaries[sec_idx + 1][0] - 1
-            elif unit_idx + 1 < len(units):
-                # Next unit's first section A
-                elem_end = units[unit_idx + 1][0][0] - 1
-            else:
-                # Last section of last unit - go to end of body
-                elem_end = total_elements - 1
-                # Skip sectPr at the end
-                while elem_end >= 0 and body_children[elem_end].tag == W_SECT_PR:
-                    elem_end -= 1
-
-            filename = f"Unit {unit_num} Sec {letter}.docx"
-            output_path = os.path.join(output_folder, filename)
-
-            create_section_file(raw_bytes, body, elem_start, elem_end, output_path)
-            created += 1
-
+    # Build the task list; each section is independent (same source bytes,
+    # its own element range and output path), so they parallelize cleanly.
+    tasks = []
+    for entry in entries:
+        if entry['letter'] in SECTIONS_TO_SKIP:
+            continue
+
+        filename = f"Unit {entry['unit_num']} Sec {entry['letter']}.docx"
+        output_path = os.path.join(output_folder, filename)
+        tasks.append((entry['start'], entry['end'], output_path))
+
+    if len(tasks) > 1 and (os.cpu_count() or 1) > 1:
+        with ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                 initializer=_pool_init,
+                                 initargs=(document_xml, source_parts)) as pool:
+            list(pool.map(_create_section_task, tasks))
+    else:
+        # Sequential fallback: parse the source once here for slicing.
+        # The zip writes (zlib + file I/O, both GIL-releasing) go to a
+        # small thread pool so they overlap the next section's XML build.
+        root = etree.fromstring(document_xml)
+        skeleton = _build_skeleton(root)
+        source_children = list(root.find(W_BODY))
+        with ThreadPoolExecutor(max_workers=4) as save_pool:
+            saves = []
+            for start, end, output_path in tasks:
+                section_xml = build_section_xml(skeleton, source_children,
+                                                start, end)
+                saves.append(save_pool.submit(_write_docx, output_path,
+                                              source_parts, section_xml))
+            for save in saves:
+                save.result()
+
+    created = len(tasks)
     print(f"  [OK] Created {created} files in '{output_folder}/'")
     return created
 